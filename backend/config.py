@@ -4,38 +4,78 @@ Survey Configuration Loader
 This module loads the survey configuration from the shared JSON file.
 The configuration file is located at config/survey.json and is shared
 between backend and frontend.
+
+The file is parsed lazily on first access of SURVEY_CONFIG and cached
+for the lifetime of the process. Read-only lookup tables derived from it
+(QUESTIONS, SEGMENTATION_RULES) are built once in the same way.
 """
 
-import json
+import functools
+import orjson
 from pathlib import Path
+from types import MappingProxyType
+
+__all__ = ["SURVEY_CONFIG", "QUESTIONS", "SEGMENTATION_RULES", "load_config"]
 
 # Get the project root directory (parent of backend directory)
 PROJECT_ROOT = Path(__file__).parent.parent
 CONFIG_PATH = PROJECT_ROOT / "config" / "survey.json"
 
 
+@functools.lru_cache(maxsize=1)
 def load_config():
     """
     Load survey configuration from JSON file.
 
+    The parsed configuration is cached, so repeated calls return the same dict.
+
     Returns:
         dict: Survey configuration dictionary
 
     Raises:
         FileNotFoundError: If config file doesn't exist
-        json.JSONDecodeError: If config file is invalid JSON
+        orjson.JSONDecodeError: If config file is invalid JSON
     """
-    if not CONFIG_PATH.exists():
+    try:
+        return orjson.loads(CONFIG_PATH.read_bytes())
+    except FileNotFoundError:
         raise FileNotFoundError(
             f"Configuration file not found at {CONFIG_PATH}. "
             "Please ensure config/survey.json exists."
-        )
+        ) from None
+
+
+@functools.lru_cache(maxsize=1)
+def get_questions():
+    """
+    Get the question mappings from the configuration.
+
+    Returns:
+        Mapping: Read-only mapping of question key -> question config
+    """
+    return MappingProxyType(load_config().get("questions", {}))
+
+
+@functools.lru_cache(maxsize=1)
+def get_segmentation_rules():
+    """
+    Get the segmentation rules from the configuration.
+
+    Returns:
+        tuple: Segmentation rules in evaluation order
+    """
+    return tuple(load_config().get("segmentation", {}).get("rules", []))
 
-    with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-        config = json.load(f)
 
-    return config
+# Module attributes that are computed on first access instead of on module import
+_LAZY_ATTRIBUTES = {
+    "SURVEY_CONFIG": load_config,
+    "QUESTIONS": get_questions,
+    "SEGMENTATION_RULES": get_segmentation_rules,
+}
 
 
-# Load configuration on module import
-SURVEY_CONFIG = load_config()
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
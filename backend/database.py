@@ -1,6 +1,7 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import StaticPool
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
 
 # Database URL - can be set via environment variable or use SQLite for development
@@ -9,38 +10,111 @@ DATABASE_URL = os.getenv(
     "sqlite:///./survey.db"  # Default to SQLite for development
 )
 
+
+# (sync URL prefix, async URL prefix) pairs used by get_async_url
+ASYNC_URL_PREFIXES = (
+    ("sqlite:", "sqlite+aiosqlite:"),
+    ("postgresql+psycopg2:", "postgresql+asyncpg:"),
+    ("postgres+psycopg2:", "postgresql+asyncpg:"),
+    ("postgresql:", "postgresql+asyncpg:"),
+    ("postgres:", "postgresql+asyncpg:"),
+)
+
+
+def get_async_url(url: str) -> str:
+    """
+    Map a synchronous database URL onto its async driver equivalent.
+    PostgreSQL URLs naming the psycopg2 driver are switched to asyncpg; URLs that
+    already name an async driver (e.g. postgresql+asyncpg://) are left untouched.
+    """
+    for prefix, async_prefix in ASYNC_URL_PREFIXES:
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+
+# Dialect-specific INSERT constructs that support on_conflict_do_update(),
+# used for upserts; only these backends are supported
+DIALECT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+# Connection pool settings, shared by all backends
+POOL_OPTIONS = {
+    "pool_size": int(os.getenv("SQLALCHEMY_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("SQLALCHEMY_MAX_OVERFLOW", "10")),
+    "pool_use_lifo": True,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+}
+
 # For SQLite, we need special configuration
 if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        DATABASE_URL,
+    engine = create_async_engine(
+        get_async_url(DATABASE_URL),
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
+        # aiosqlite defaults to NullPool; keep connections pooled instead
+        poolclass=AsyncAdaptedQueuePool,
+        **POOL_OPTIONS,
     )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        Enable WAL journaling so readers are not blocked by a writer,
+        and relax fsync to once per checkpoint instead of once per commit.
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
 else:
-    # For PostgreSQL, MySQL, etc.
-    engine = create_engine(DATABASE_URL)
+    # For PostgreSQL
+    engine = create_async_engine(get_async_url(DATABASE_URL), **POOL_OPTIONS)
+
+# Fail at startup rather than on the first webhook if upserts can't be built
+if engine.dialect.name not in DIALECT_INSERTS:
+    raise RuntimeError(
+        f"Unsupported database dialect {engine.dialect.name!r} in DATABASE_URL; "
+        "use SQLite or PostgreSQL."
+    )
 
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False keeps loaded attributes usable after commit
+# without an extra refresh query.
+AsyncSessionLocal = async_sessionmaker(
+    bind=engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
 
 
-def get_db() -> Session:
+def dialect_insert(model):
+    """
+    Build an INSERT for the configured backend that supports
+    on_conflict_do_update() (SQLite and PostgreSQL).
+    The dialect is checked when the engine is created.
+    """
+    return DIALECT_INSERTS[engine.dialect.name](model)
+
+
+async def get_db() -> AsyncSession:
     """
     Dependency function to get database session.
     Use this in FastAPI route dependencies.
     """
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def init_db():
+async def init_db():
     """
     Initialize database by creating all tables.
     Call this once when setting up the application.
     """
     from models import Base
-    Base.metadata.create_all(bind=engine)
-
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
@@ -1,12 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update, case, func
+from sqlalchemy.orm import load_only
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from database import get_db
 from models import UserSession
-import uuid
+import asyncio
+import io
 import os
-import requests
+import secrets
+import re
+import httpx
+import orjson
 import logging
+import weakref
+from cachetools import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +29,129 @@ if not ELEVENLABS_AGENT_ID:
 if not ELEVENLABS_API_KEY:
     logger.warning("ELEVENLABS_API_KEY not set in environment variables")
 
+# Separator placed between transcripts of consecutive conversation sessions
+TRANSCRIPT_SEPARATOR = (
+    "\n\n" + "=" * 80 + "\n"
+    "--- Conversation Resumed ---\n"
+    + "=" * 80 + "\n\n"
+)
+
+# Phrases in a transcript that suggest the agent wrapped up the interview (lowercase)
+COMPLETION_INDICATORS = (
+    "that's all",
+    "completed",
+    "all questions answered",
+    "concludes",
+    "valuable feedback",
+    "have a great day",
+)
+
+# Minimum number of AGENT and USER turns for a transcript to count as complete
+MIN_COMPLETED_EXCHANGES = 13
+
+# Single pattern matching the turn markers (group 1: agent, group 2: user) and,
+# case-insensitively, the completion indicators (group 3). One scan over the
+# transcript yields everything the completion check needs, without lowercasing a copy.
+TRANSCRIPT_SCAN_RE = re.compile(
+    r"(\[AGENT\]:)|(\[USER\]:)|(?i:("
+    + "|".join(map(re.escape, COMPLETION_INDICATORS))
+    + "))"
+)
+
+# Shared HTTP client so ElevenLabs connections are kept alive across requests.
+# The transport retries failed connection attempts; transient gateway errors
+# are retried in get_with_retries().
+http_client = httpx.AsyncClient(
+    timeout=30,
+    transport=httpx.AsyncHTTPTransport(
+        retries=3,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+    ),
+)
+
+RETRY_STATUS_CODES = frozenset({502, 503, 504})
+MAX_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.3
+
+
+async def get_with_retries(url: str, headers: dict) -> httpx.Response:
+    """
+    GET a URL with the shared client, retrying gateway errors with exponential backoff.
+    The last response is returned as-is once retries are exhausted.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        response = await http_client.get(url, headers=headers)
+        if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+            return response
+        await response.aclose()
+        await asyncio.sleep(RETRY_BACKOFF_FACTOR * (2 ** attempt))
+
+
+def iter_transcript_lines(transcript_messages):
+    """
+    Yield one formatted line per ElevenLabs transcript message.
+    Message dicts become "[ROLE]: text"; messages without text are skipped.
+    """
+    for msg in transcript_messages:
+        if isinstance(msg, dict):
+            text = msg.get("message") or msg.get("text") or ""
+            if text:
+                yield f"[{msg.get('role', 'unknown').upper()}]: {text}\n"
+        elif isinstance(msg, str):
+            yield f"{msg}\n"
+
+
+# Recently fetched transcripts keyed by conversation_id, so a repeated completion
+# of the same conversation (e.g. when restarting an interview) skips the API call.
+# Only final transcripts are cached: a conversation that is still live or being
+# processed by ElevenLabs is fetched again on every call.
+FINISHED_CONVERSATION_STATUS = "done"
+TRANSCRIPT_CACHE = TTLCache(maxsize=2048, ttl=300)
+# Per-conversation locks so concurrent completions share a single fetch
+TRANSCRIPT_LOCKS = weakref.WeakValueDictionary()
+
+
+async def fetch_transcript(conversation_id: str) -> str:
+    """
+    Fetch a conversation transcript from ElevenLabs and format it as text.
+    Non-empty transcripts of finished conversations are cached briefly by conversation_id.
+    """
+    lock = TRANSCRIPT_LOCKS.get(conversation_id)
+    if lock is None:
+        lock = TRANSCRIPT_LOCKS[conversation_id] = asyncio.Lock()
+
+    async with lock:
+        cached = TRANSCRIPT_CACHE.get(conversation_id)
+        if cached is not None:
+            return cached
+
+        url = f"https://api.elevenlabs.io/v1/convai/conversations/{conversation_id}"
+        headers = {"xi-api-key": ELEVENLABS_API_KEY}
+
+        response = await get_with_retries(url, headers)
+        response.raise_for_status()
+
+        data = orjson.loads(response.content)
+
+        transcript_messages = data.get("transcript", [])
+        # Extract Transcript - handle different possible response structures
+        formatted_transcript = ""
+
+        if isinstance(transcript_messages, list) and len(transcript_messages) > 0:
+            # Stream lines into one buffer to avoid quadratic string concatenation
+            buffer = io.StringIO()
+            buffer.writelines(iter_transcript_lines(transcript_messages))
+            formatted_transcript = buffer.getvalue()
+        elif isinstance(transcript_messages, str):
+            formatted_transcript = transcript_messages
+        else:
+            logger.warning("Unexpected transcript format. Response keys: %s", list(data))
+
+        new_transcript = formatted_transcript.strip()
+        if new_transcript and data.get("status") == FINISHED_CONVERSATION_STATUS:
+            TRANSCRIPT_CACHE[conversation_id] = new_transcript
+        return new_transcript
+
 
 class StartInterviewRequest(BaseModel):
     user_id: str
@@ -40,7 +171,7 @@ class UpdateIdRequest(BaseModel):
 @router.post("/start", response_model=StartInterviewResponse)
 async def start_interview(
     request: StartInterviewRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Start an ElevenLabs AI agent conversation for a user.
@@ -61,10 +192,11 @@ async def start_interview(
                 detail="ElevenLabs Agent ID is missing. Please set ELEVENLABS_AGENT_ID environment variable."
             )
 
-        # Get or create user session
-        user_session = db.query(UserSession).filter(
-            UserSession.user_id == user_id
-        ).first()
+        # Look up the session, fetching only the columns needed here
+        user_session = (await db.execute(
+            select(UserSession.id, UserSession.elevenlabs_conversation_id)
+            .where(UserSession.user_id == user_id)
+        )).first()
 
         if not user_session:
             raise HTTPException(
@@ -72,11 +204,14 @@ async def start_interview(
                 detail=f"User session not found for user_id: {user_id}. Please complete the survey first."
             )
 
-        if user_session.elevenlabs_conversation_id:
+        if user_session.elevenlabs_conversation_id and ELEVENLABS_API_KEY:
             try:
                 # We await the completion logic to fetch & append the old transcript
                 # to the database before the new session overwrites the ID.
-                await complete_interview(user_id, db)
+                # The conversation id was just read, so the session isn't queried again.
+                await save_conversation_transcript(
+                    db, user_id, user_session.elevenlabs_conversation_id
+                )
             except Exception:
                 # If saving fails (e.g. API error), we proceed anyway so the user
                 # isn't blocked from starting their new interview.
@@ -84,13 +219,16 @@ async def start_interview(
 
         # Generate a conversation_id for tracking
         # The ElevenLabs widget will handle the actual conversation creation
-        # We generate a UUID to track this conversation session
-        conversation_id = str(uuid.uuid4())
+        # We generate a random 128-bit hex token to track this conversation session
+        conversation_id = secrets.token_hex(16)
 
         # Update user session with conversation_id
-        user_session.elevenlabs_conversation_id = conversation_id
-        db.commit()
-        db.refresh(user_session)
+        await db.execute(
+            update(UserSession)
+            .where(UserSession.id == user_session.id)
+            .values(elevenlabs_conversation_id=conversation_id)
+        )
+        await db.commit()
 
         return StartInterviewResponse(
             conversation_id=conversation_id,
@@ -101,7 +239,7 @@ async def start_interview(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error starting interview: {str(e)}", exc_info=True)
+        logger.error("Error starting interview: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"Error starting interview: {str(e)}"
@@ -111,15 +249,24 @@ async def start_interview(
 @router.get("/session/{user_id}")
 async def get_session_info(
     user_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get session information including conversation_id for a user.
     """
     try:
-        user_session = db.query(UserSession).filter(
-            UserSession.user_id == user_id
-        ).first()
+        user_session = await db.scalar(
+            select(UserSession)
+            .options(load_only(
+                UserSession.user_id,
+                UserSession.elevenlabs_conversation_id,
+                UserSession.survey_status,
+                UserSession.segment,
+                UserSession.transcript,
+                UserSession.created_at,
+            ))
+            .where(UserSession.user_id == user_id)
+        )
 
         if not user_session:
             raise HTTPException(
@@ -146,117 +293,111 @@ async def get_session_info(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting session info: {str(e)}", exc_info=True)
+        logger.error("Error getting session info: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"Error getting session info: {str(e)}"
         )
 
-@router.post("/complete/{user_id}")
-async def complete_interview(
-    user_id: str,
-    db: Session = Depends(get_db)
-):
+
+async def save_conversation_transcript(db: AsyncSession, user_id: str, conversation_id: str):
     """
-    Mark interview as complete, fetch transcript from ElevenLabs, and store it in the database.
+    Fetch a conversation transcript from ElevenLabs and append it to the user's
+    stored transcript. start_interview calls this directly with the conversation
+    id it already has, instead of going through complete_interview's lookup.
     """
-    if not ELEVENLABS_API_KEY:
-        raise HTTPException(500, "Server misconfiguration: Missing ELEVENLABS_API_KEY")
-
-    user_session = db.query(UserSession).filter(UserSession.user_id == user_id).first()
-    if not user_session:
-        raise HTTPException(404, f"User session not found for user_id: {user_id}")
-
-    if not user_session.elevenlabs_conversation_id:
-        raise HTTPException(404, "No conversation ID found for this user session")
-
-    conversation_id = user_session.elevenlabs_conversation_id
+    # End the caller's read transaction so its pooled connection is returned
+    # while the ElevenLabs request is in flight
+    await db.rollback()
 
     try:
-        # 1. Fetch Transcript from ElevenLabs API
-        url = f"https://api.elevenlabs.io/v1/convai/conversations/{conversation_id}"
-        headers = {"xi-api-key": ELEVENLABS_API_KEY}
-
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-
-        data = response.json()
-
-        transcript_messages = data.get("transcript", [])
-        # 2. Extract Transcript - handle different possible response structures
-        formatted_transcript = ""
-
-        if isinstance(transcript_messages, list) and len(transcript_messages) > 0:
-            for msg in transcript_messages:
-                if isinstance(msg, dict):
-                    role = msg.get("role", "unknown")
-                    text = msg.get("message") or msg.get("text") or ""
-                    if text:
-                        formatted_transcript += f"[{role.upper()}]: {text}\n"
-                elif isinstance(msg, str):
-                    formatted_transcript += f"{msg}\n"
-        elif isinstance(transcript_messages, str):
-            formatted_transcript = transcript_messages
-        else:
-            logger.warning(f"Unexpected transcript format. Response keys: {list(data.keys())}")
-
-        # 3. Append to existing transcript (if any) and save to Database
-        new_transcript = formatted_transcript.strip()
-        existing_transcript = user_session.transcript or ""
-
-        # If there's existing transcript, append the new one with a separator
-        if existing_transcript and existing_transcript.strip():
-            # Add a separator to distinguish between conversation sessions
-            separator = "\n\n" + "="*80 + "\n"
-            separator += f"--- Conversation Resumed ---\n"
-            separator += "="*80 + "\n\n"
-            combined_transcript = existing_transcript + separator + new_transcript
-            user_session.transcript = combined_transcript
-        else:
-            # First transcript, just save it
-            user_session.transcript = new_transcript
+        # 1. Fetch Transcript from ElevenLabs API (or the recent-fetch cache)
+        new_transcript = await fetch_transcript(conversation_id)
+
+        # 2. Append to existing transcript (if any) and save to Database.
+        # A separator distinguishes conversation sessions when a transcript already
+        # exists. The concatenation runs inside the UPDATE and RETURNING hands back
+        # the stored value, so the old transcript is never loaded into Python.
+        combined_transcript = case(
+            (func.trim(func.coalesce(UserSession.transcript, "")) == "", new_transcript),
+            else_=UserSession.transcript + TRANSCRIPT_SEPARATOR + new_transcript,
+        )
+        transcript = (await db.execute(
+            update(UserSession)
+            .where(UserSession.user_id == user_id)
+            .values(transcript=combined_transcript)
+            .returning(UserSession.transcript)
+            .execution_options(synchronize_session=False)
+        )).scalar_one()
 
         # Commit the transaction
-        db.commit()
-        db.refresh(user_session)
+        await db.commit()
 
         # Return the full accumulated transcript
         return {
             "status": "success",
-            "transcript": user_session.transcript,  # Return the full accumulated transcript
+            "transcript": transcript,  # Return the full accumulated transcript
             "new_transcript": new_transcript,  # Also return just the new portion
             "message": "Transcript saved successfully"
         }
 
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         error_detail = f"HTTP {e.response.status_code}: {e.response.text if hasattr(e, 'response') else str(e)}"
-        logger.error(f"ElevenLabs API HTTP Error: {error_detail}")
+        logger.error("ElevenLabs API HTTP Error: %s", error_detail)
         raise HTTPException(502, f"Failed to retrieve transcript from ElevenLabs: {error_detail}")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"ElevenLabs API Request Error: {str(e)}")
+    except httpx.RequestError as e:
+        logger.error("ElevenLabs API Request Error: %s", e)
         raise HTTPException(502, f"Failed to connect to ElevenLabs API: {str(e)}")
     except Exception as e:
-        logger.error(f"Error saving transcript: {str(e)}", exc_info=True)
-        db.rollback()  # Rollback on error
+        logger.error("Error saving transcript: %s", e, exc_info=True)
+        await db.rollback()  # Rollback on error
         raise HTTPException(500, f"Internal error while saving transcript: {str(e)}")
 
 
+@router.post("/complete/{user_id}")
+async def complete_interview(
+    user_id: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Mark interview as complete, fetch transcript from ElevenLabs, and store it in the database.
+    """
+    if not ELEVENLABS_API_KEY:
+        raise HTTPException(500, "Server misconfiguration: Missing ELEVENLABS_API_KEY")
+
+    user_session = (await db.execute(
+        select(UserSession.elevenlabs_conversation_id).where(UserSession.user_id == user_id)
+    )).first()
+    if not user_session:
+        raise HTTPException(404, f"User session not found for user_id: {user_id}")
+
+    if not user_session.elevenlabs_conversation_id:
+        raise HTTPException(404, "No conversation ID found for this user session")
+
+    conversation_id = user_session.elevenlabs_conversation_id
+
+    return await save_conversation_transcript(db, user_id, conversation_id)
+
+
 @router.post("/update-id")
 async def update_conversation_id(
     request: UpdateIdRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update the session with the real conversation_id from ElevenLabs SDK
     """
-    user_session = db.query(UserSession).filter(UserSession.user_id == request.user_id).first()
-
-    if not user_session:
+    # Single UPDATE; a zero rowcount means the session does not exist
+    result = await db.execute(
+        update(UserSession)
+        .where(UserSession.user_id == request.user_id)
+        .values(elevenlabs_conversation_id=request.conversation_id)
+    )
+
+    if result.rowcount == 0:
         raise HTTPException(404, "User session not found")
 
-    user_session.elevenlabs_conversation_id = request.conversation_id
-    db.commit()
-    db.refresh(user_session)
+    await db.commit()
 
     return {"status": "updated"}
 
@@ -264,19 +405,22 @@ async def update_conversation_id(
 @router.get("/check-completion/{user_id}")
 async def check_conversation_completion(
     user_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Check if the conversation is complete by analyzing the transcript.
     Returns whether all questions have been answered.
     """
     try:
-        user_session = db.query(UserSession).filter(UserSession.user_id == user_id).first()
+        # Only the transcript column is needed for the completion heuristic
+        row = (await db.execute(
+            select(UserSession.transcript).where(UserSession.user_id == user_id)
+        )).first()
 
-        if not user_session:
+        if not row:
             raise HTTPException(404, f"User session not found for user_id: {user_id}")
 
-        transcript = user_session.transcript
+        transcript = row.transcript
 
         if not transcript or not transcript.strip():
             return {
@@ -286,29 +430,23 @@ async def check_conversation_completion(
             }
 
         # Simple heuristic: Check if transcript contains completion indicators
+        # or enough question-answer exchanges (AGENT and USER messages).
         # You can customize this based on your agent's behavior
-        transcript_lower = transcript.lower()
-
-        # Check for completion indicators
-        completion_indicators = [
-            "that's all",
-            "completed",
-            "all questions answered",
-            "concludes",
-            "valuable feedback",
-            "Have a great day"
-        ]
-
-        # Check for question-answer patterns
-        # Count AGENT and USER messages
-        agent_messages = len(transcript.split('[AGENT]:')) - 1
-        user_messages = len(transcript.split('[USER]:')) - 1
-
-        # If there are multiple exchanges and the last message suggests completion
-        is_complete = (
-            (any(indicator in transcript_lower for indicator in completion_indicators) or
-             (agent_messages >= 13 and user_messages >= 13))
-        )
+        agent_messages = user_messages = 0
+        is_complete = False
+
+        # Single pass over the transcript that stops as soon as either holds
+        for match in TRANSCRIPT_SCAN_RE.finditer(transcript):
+            if match.lastindex == 3:
+                is_complete = True
+                break
+            if match.lastindex == 1:
+                agent_messages += 1
+            else:
+                user_messages += 1
+            if agent_messages >= MIN_COMPLETED_EXCHANGES and user_messages >= MIN_COMPLETED_EXCHANGES:
+                is_complete = True
+                break
 
         return {
             "is_complete": is_complete,
@@ -320,5 +458,5 @@ async def check_conversation_completion(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error checking conversation completion: {str(e)}", exc_info=True)
+        logger.error("Error checking conversation completion: %s", e, exc_info=True)
         raise HTTPException(500, f"Error checking completion: {str(e)}")
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Integer, Text, Enum as SQLEnum
+from sqlalchemy import Column, String, DateTime, Integer, Text, Index, Enum as SQLEnum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 import enum
@@ -21,6 +21,16 @@ class UserSession(Base):
     Stores information about user sessions including survey status, segmentation, and related data.
     """
     __tablename__ = "user_sessions"
+    __table_args__ = (
+        # Composite index for per-user lookups of the conversation id. On PostgreSQL the
+        # INCLUDE columns make session lookups index-only; other backends ignore them.
+        Index(
+            "ix_user_sessions_user_id_conversation",
+            "user_id",
+            "elevenlabs_conversation_id",
+            postgresql_include=["survey_status", "segment", "created_at"],
+        ),
+    )
 
     # Primary key
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from functools import cached_property
+from pydantic import BaseModel, ConfigDict
+from typing import List, Dict, Optional, Any, Tuple
 
 class Hidden(BaseModel):
     """Represents the hidden section of the TypeForm webhook payload."""
@@ -16,18 +17,22 @@ class Field(BaseModel):
 
 class Definition(BaseModel):
     """Represents the form definition section containing field mappings."""
+    model_config = ConfigDict(frozen=True)
+
     fields: List[Field]
 
+    @cached_property
+    def _fields_by_id(self) -> Dict[str, Field]:
+        """Index of field definitions by ID, built on first use."""
+        return {field.id: field for field in self.fields}
+
     def get_field_by_id(self, field_id: str) -> Optional[Field]:
         """Get a field definition by its ID."""
-        for field in self.fields:
-            if field.id == field_id:
-                return field
-        return None
+        return self._fields_by_id.get(field_id)
 
     def get_field_mapping(self) -> Dict[str, str]:
         """Get a mapping of field IDs to field titles."""
-        return {field.id: field.title for field in self.fields}
+        return {field_id: field.title for field_id, field in self._fields_by_id.items()}
 
 
 class Answer(BaseModel):
@@ -55,24 +60,23 @@ class FormResponse(BaseModel):
     token: Optional[str] = None
     submitted_at: Optional[str] = None
 
-    def get_answers_with_questions(self) -> List[Dict[str, Any]]:
-        """Get answers mapped to their question titles."""
-        field_mapping = self.definition.get_field_mapping()
-        result = []
-
-        for answer in self.answers:
-            question_id = answer.field.id
-            question_title = field_mapping.get(question_id, "Unknown Question")
-            answer_value = answer.get_answer_value()
-
-            result.append({
-                "question_id": question_id,
-                "question_title": question_title,
-                "answer": answer_value,
+    @cached_property
+    def answers_with_questions(self) -> Tuple[Dict[str, Any], ...]:
+        """Answers mapped to their question titles, built once per response."""
+        title_for = self.definition.get_field_mapping().get
+        return tuple(
+            {
+                "question_id": answer.field.id,
+                "question_title": title_for(answer.field.id, "Unknown Question"),
+                "answer": answer.get_answer_value(),
                 "answer_type": answer.type
-            })
+            }
+            for answer in self.answers
+        )
 
-        return result
+    def get_answers_with_questions(self) -> List[Dict[str, Any]]:
+        """Get answers mapped to their question titles."""
+        return list(self.answers_with_questions)
 
 
 class TypeformWebhookPayload(BaseModel):
@@ -3,71 +3,236 @@ Segment Logic Helper
 
 This module provides functions to evaluate segmentation rules based on survey responses.
 It uses the configuration from config.py to determine user segments.
+
+The segmentation rules are compiled once at import into plain predicate functions,
+so each webhook only runs the checks instead of re-interpreting the rule config.
 """
 
-from config import SURVEY_CONFIG
+import sys
+
+from config import SURVEY_CONFIG, QUESTIONS, SEGMENTATION_RULES
 from models import SurveyStatus
 
+# Convert status strings from the configuration to SurveyStatus enum
+STATUS_MAP = {
+    "completed": SurveyStatus.COMPLETED,
+    "terminated": SurveyStatus.TERMINATED,
+    "pending": SurveyStatus.PENDING,
+    "in_progress": SurveyStatus.IN_PROGRESS,
+    "failed": SurveyStatus.FAILED
+}
+
 
-def evaluate_segment_conditions(answers, conditions):
+def to_lookup_set(values):
     """
-    Evaluate if answers match the given conditions.
+    Build a set for fast membership tests, falling back to a tuple
+    when the configured values are not hashable.
+    """
+    try:
+        return frozenset(values)
+    except TypeError:
+        return tuple(values)
 
-    Args:
-        answers: Dictionary of question_id -> answer_value
-        conditions: Dictionary of condition rules from config
 
-    Returns:
-        bool: True if all conditions are met
-    """
-    for question_key, condition in conditions.items():
+def compile_not_contains(question_key, condition):
+    """Predicate for "not_contains": the answer must not contain any excluded value."""
+    exclude_values = tuple(condition.get("exclude", []))
+
+    def predicate(answers):
         answer_value = answers.get(question_key)
+        if answer_value is None:
+            return False
+        if isinstance(answer_value, str):
+            return not any(exclude in answer_value for exclude in exclude_values)
+        if isinstance(answer_value, list):
+            # Check each selected option rather than the list's repr
+            return not any(
+                exclude in item
+                for item in map(str, answer_value)
+                for exclude in exclude_values
+            )
+        answer_text = str(answer_value)
+        return not any(exclude in answer_text for exclude in exclude_values)
+    return predicate
+
 
+def compile_list_contains(question_key, condition):
+    """Predicate for list "contains"/"contains_any": any expected value is in the answer list."""
+    expected_values = condition.get("values", [])
+    expected_set = to_lookup_set(expected_values)
+
+    def predicate(answers):
+        answer_value = answers.get(question_key)
         if answer_value is None:
             return False
+        if not isinstance(answer_value, list):
+            answer_value = [answer_value] if answer_value else []
+        try:
+            return not expected_set.isdisjoint(answer_value)
+        except (AttributeError, TypeError):
+            return any(val in answer_value for val in expected_values)
+    return predicate
+
+
+def compile_list_equals(question_key, condition):
+    """Predicate for other list operators: the answer list must match the expected values."""
+    expected_list = list(condition.get("values", []))
+
+    def predicate(answers):
+        answer_value = answers.get(question_key)
+        if answer_value is None:
+            return False
+        if not isinstance(answer_value, list):
+            answer_value = [answer_value] if answer_value else []
+        return answer_value == expected_list
+    return predicate
 
-        operator = condition.get("operator", "equals")
-        expected_values = condition.get("values", [])
-        exclude_values = condition.get("exclude", [])
-        is_list = condition.get("type") == "list"
-
-        # Handle exclude operator (e.g., "not contains")
-        if operator == "not_contains":
-            if any(exclude in str(answer_value) for exclude in exclude_values):
-                return False
-            continue
-
-        # Handle list/array fields
-        if is_list:
-            if not isinstance(answer_value, list):
-                answer_value = [answer_value] if answer_value else []
-
-            if operator == "contains":
-                # Check if any expected value is in the answer list
-                if not any(val in answer_value for val in expected_values):
-                    return False
-            elif operator == "contains_any":
-                # Check if any expected value is in the answer list
-                if not any(val in answer_value for val in expected_values):
-                    return False
-            else:
-                # For other operators, check if answer list matches
-                if answer_value != expected_values:
-                    return False
-        else:
-            # Handle single value fields
-            if operator == "in":
-                if answer_value not in expected_values:
-                    return False
-            elif operator == "equals":
-                if answer_value != expected_values[0] if expected_values else None:
-                    return False
-            else:
-                # Default: check if answer matches any expected value
-                if answer_value not in expected_values:
-                    return False
 
-    return True
+def compile_equals(question_key, condition):
+    """Predicate for single value "equals": the answer must equal the first expected value."""
+    expected_values = condition.get("values", [])
+    if not expected_values:
+        return lambda answers: answers.get(question_key) is not None
+    expected_value = expected_values[0]
+
+    def predicate(answers):
+        answer_value = answers.get(question_key)
+        return answer_value is not None and answer_value == expected_value
+    return predicate
+
+
+def compile_in(question_key, condition):
+    """Predicate for single value "in" (and unknown operators): the answer is one of the expected values."""
+    expected_values = condition.get("values", [])
+    expected_set = to_lookup_set(expected_values)
+
+    def predicate(answers):
+        answer_value = answers.get(question_key)
+        if answer_value is None:
+            return False
+        try:
+            return answer_value in expected_set
+        except TypeError:
+            # Unhashable answers (lists, dicts) can't equal a configured value
+            return answer_value in expected_values
+    return predicate
+
+
+# Operator -> predicate compiler, for list ("type": "list") and single value fields.
+# Operators missing from a table fall back to its default compiler.
+LIST_OPERATOR_COMPILERS = {
+    "not_contains": compile_not_contains,
+    "contains": compile_list_contains,
+    "contains_any": compile_list_contains,
+}
+OPERATOR_COMPILERS = {
+    "not_contains": compile_not_contains,
+    "equals": compile_equals,
+    "in": compile_in,
+}
+
+
+def compile_condition(question_key, condition):
+    """
+    Compile a single condition from config into a predicate.
+
+    Args:
+        question_key: Key of the question the condition applies to
+        condition: Condition rule from config
+
+    Returns:
+        callable: Function taking the answers dictionary and returning True if the condition is met
+    """
+    operator = condition.get("operator", "equals")
+    if condition.get("type") == "list":
+        compiler = LIST_OPERATOR_COMPILERS.get(operator, compile_list_equals)
+    else:
+        compiler = OPERATOR_COMPILERS.get(operator, compile_in)
+    return compiler(question_key, condition)
+
+
+def condition_cost(condition):
+    """
+    Rank a condition by how expensive it is to check: set lookups and equality first,
+    list scans next, substring scans for "not_contains" last.
+    """
+    if condition.get("operator", "equals") == "not_contains":
+        return 2
+    if condition.get("type") == "list":
+        return 1
+    return 0
+
+
+def compile_conditions(conditions):
+    """
+    Compile a dictionary of condition rules into a tuple of predicates.
+    Predicates are ordered cheapest first so a failing rule is rejected as early as possible.
+    """
+    ordered = sorted(conditions.items(), key=lambda item: condition_cost(item[1]))
+    return tuple(
+        compile_condition(question_key, condition)
+        for question_key, condition in ordered
+    )
+
+
+def compile_rule(rule):
+    """
+    Compile a segmentation rule from config.
+
+    Returns:
+        tuple: (predicates, (segment_name, survey_status)), where the inner tuple is
+        the result returned as-is when the rule matches
+    """
+    return (
+        compile_conditions(rule["conditions"]),
+        (
+            sys.intern(rule["segment"]),
+            STATUS_MAP.get(rule["status"], SurveyStatus.TERMINATED),
+        ),
+    )
+
+
+def extract_answer(response, answer_type):
+    """
+    Extract the answer value from a survey response according to the question type.
+
+    Args:
+        response: Survey response dictionary with question_title and answer
+        answer_type: Question type from config ("choice", "choices", ...)
+
+    Returns:
+        The label for "choice", a list of labels for "choices", otherwise the raw answer
+    """
+    if answer_type == 'choice':
+        answer = response.get('answer', {})
+        if isinstance(answer, dict):
+            return answer.get('label')
+        return answer
+    elif answer_type == 'choices':
+        answer = response.get('answer', {})
+        if isinstance(answer, dict):
+            return answer.get('labels', [])
+        return answer if isinstance(answer, list) else [answer]
+    else:
+        return response.get('answer')
+
+
+# (lowercased partial_title, question_key, answer_type) for each configured question,
+# in config order, so response titles can be matched without re-reading the config
+QUESTION_INDEX = tuple(
+    (question_config["partial_title"].lower(), question_key, question_config["type"])
+    for question_key, question_config in QUESTIONS.items()
+    if question_config
+)
+
+# Rules compiled once at import, in evaluation order
+COMPILED_RULES = tuple(compile_rule(rule) for rule in SEGMENTATION_RULES)
+
+# (segment_name, survey_status) returned when no rule matches
+DEFAULT_SEGMENT = (
+    sys.intern(SURVEY_CONFIG["segmentation"]["default_segment"]),
+    STATUS_MAP.get(SURVEY_CONFIG["segmentation"]["default_status"], SurveyStatus.TERMINATED),
+)
 
 
 def determine_segment(survey_responses):
@@ -80,68 +245,26 @@ def determine_segment(survey_responses):
     Returns:
         tuple: (segment_name, survey_status)
     """
-    config = SURVEY_CONFIG
-
-    # Helper to find answer by question key
-    def get_answer_value(question_key):
-        question_config = config["questions"].get(question_key)
-        if not question_config:
-            return None
-
-        partial_title = question_config["partial_title"]
-        answer_type = question_config["type"]
-
-        for response in survey_responses:
-            question_title = response.get('question_title', '').lower()
-            if partial_title.lower() in question_title:
-                if answer_type == 'choice':
-                    answer = response.get('answer', {})
-                    if isinstance(answer, dict):
-                        return answer.get('label')
-                    return answer
-                elif answer_type == 'choices':
-                    answer = response.get('answer', {})
-                    if isinstance(answer, dict):
-                        return answer.get('labels', [])
-                    return answer if isinstance(answer, list) else [answer]
-                else:
-                    return response.get('answer')
-        return None
-
-    # Extract all answers
-    answers = {}
-    for question_key in config["questions"].keys():
-        answers[question_key] = get_answer_value(question_key)
-
-    # Evaluate rules in order
-    for rule in config["segmentation"]["rules"]:
-        if evaluate_segment_conditions(answers, rule["conditions"]):
-            segment = rule["segment"]
-            status_str = rule["status"]
-
-            # Convert status string to SurveyStatus enum
-            status_map = {
-                "completed": SurveyStatus.COMPLETED,
-                "terminated": SurveyStatus.TERMINATED,
-                "pending": SurveyStatus.PENDING,
-                "in_progress": SurveyStatus.IN_PROGRESS,
-                "failed": SurveyStatus.FAILED
-            }
-            status = status_map.get(status_str, SurveyStatus.TERMINATED)
-
-            return segment, status
+    # Extract all answers in a single pass over the responses. Each question takes
+    # the answer of the first response whose title contains its partial title.
+    answers = dict.fromkeys(QUESTIONS)
+    found = set()
+    for response in survey_responses:
+        if len(found) == len(QUESTION_INDEX):
+            break
+        question_title = (response.get('question_title') or '').lower()
+        for partial_title, question_key, answer_type in QUESTION_INDEX:
+            if question_key not in found and partial_title in question_title:
+                answers[question_key] = extract_answer(response, answer_type)
+                found.add(question_key)
 
-    # Default segment if no rules match
-    default_segment = config["segmentation"]["default_segment"]
-    default_status_str = config["segmentation"]["default_status"]
-    status_map = {
-        "completed": SurveyStatus.COMPLETED,
-        "terminated": SurveyStatus.TERMINATED,
-        "pending": SurveyStatus.PENDING,
-        "in_progress": SurveyStatus.IN_PROGRESS,
-        "failed": SurveyStatus.FAILED
-    }
-    default_status = status_map.get(default_status_str, SurveyStatus.TERMINATED)
-
-    return default_segment, default_status
+    # Evaluate rules in order; a rule matches when all of its predicates hold
+    for predicates, result in COMPILED_RULES:
+        for predicate in predicates:
+            if not predicate(answers):
+                break
+        else:
+            return result
 
+    # Default segment if no rules match
+    return DEFAULT_SEGMENT
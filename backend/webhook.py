@@ -1,115 +1,268 @@
-from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from schemas import TypeformWebhookPayload
-from database import get_db, init_db
+from database import AsyncSessionLocal, init_db, dialect_insert
 from models import UserSession, SurveyStatus
-from interview import router as interview_router
+from interview import router as interview_router, http_client
 from segment_logic import determine_segment
 from datetime import datetime
+from collections import OrderedDict
+import asyncio
 import logging
-import json
+import os
+import sys
+import orjson
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (override the level with LOG_LEVEL, e.g. DEBUG or WARNING)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="TypeForm Webhook Handler")
+app = FastAPI(
+    title="TypeForm Webhook Handler",
+    default_response_class=ORJSONResponse,
+)
+
+# Browser origins allowed to call the API (comma-separated). The Typeform webhook
+# is a server-to-server call and is not subject to CORS.
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
+    if origin.strip()
+]
 
 # Add CORS middleware
+# Preflight responses are cached by the browser for max_age seconds
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization"],
+    max_age=86400,
 )
 
 # Include interview router
 app.include_router(interview_router)
 
+# datetime.fromisoformat accepts Typeform's trailing "Z" natively from Python 3.11
+if sys.version_info >= (3, 11):
+    parse_iso_datetime = datetime.fromisoformat
+else:
+    def parse_iso_datetime(value):
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+# Fingerprints of recently saved webhook events (event_id -> hash of the outcome), so
+# Typeform redeliveries of an event that was already written skip the database
+PROCESSED_EVENTS_MAX = 10_000
+processed_events = OrderedDict()
+
+
+def remember_processed_event(event_id, fingerprint):
+    """Record a saved event, evicting the oldest entries beyond PROCESSED_EVENTS_MAX."""
+    processed_events[event_id] = fingerprint
+    processed_events.move_to_end(event_id)
+    if len(processed_events) > PROCESSED_EVENTS_MAX:
+        processed_events.popitem(last=False)
+
+# Webhook session upserts are queued and written by a background task in batches,
+# so a burst of submissions shares one commit instead of paying for one each.
+# Each queue item is (row, future); the future resolves once the row is committed.
+# A None item stops the writer after the rows queued before it are written.
+SESSION_WRITE_BATCH_SIZE = 64
+# Seconds a webhook waits for its row to be committed before answering 503,
+# so a stalled writer or database can't hold the request open indefinitely
+SESSION_WRITE_TIMEOUT = 10
+session_write_queue = asyncio.Queue()
+
+
+def session_upsert_statement():
+    """
+    Build the INSERT ... ON CONFLICT (user_id) DO UPDATE statement used for webhook writes.
+    Existing sessions only get their status, segment and submission time updated.
+    """
+    stmt = dialect_insert(UserSession)
+    return stmt.on_conflict_do_update(
+        index_elements=[UserSession.user_id],
+        set_={
+            "survey_status": stmt.excluded.survey_status,
+            "segment": stmt.excluded.segment,
+            "submitted_at": stmt.excluded.submitted_at,
+            "updated_at": func.now(),
+        }
+    )
+
+
+async def execute_session_upserts(rows):
+    """Upsert session rows in one transaction."""
+    async with AsyncSessionLocal() as db:
+        await db.execute(session_upsert_statement(), rows)
+        await db.commit()
+
+
+async def write_session_batch(batch):
+    """
+    Upsert a batch of queued session rows in one transaction and resolve their futures.
+    If the batch fails (e.g. one row collides on event_id or form_token), its rows are
+    retried one at a time so only the offending requests see the error.
+    """
+    # A user can only be upserted once per statement; the latest submission wins
+    rows = {row["user_id"]: row for row, _ in batch}
+    errors = {}
+    try:
+        await execute_session_upserts(list(rows.values()))
+    except Exception as e:
+        if len(rows) == 1:
+            errors = dict.fromkeys(rows, e)
+        else:
+            logger.warning("Batched session write failed, retrying rows one at a time: %s", e)
+            for user_id, row in rows.items():
+                try:
+                    await execute_session_upserts([row])
+                except Exception as row_error:
+                    errors[user_id] = row_error
+
+    for row, future in batch:
+        if future.done():
+            continue
+        error = errors.get(row["user_id"])
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+
+async def run_session_writer():
+    """Drain the session write queue, writing whatever has accumulated as one batch."""
+    while True:
+        batch = [await session_write_queue.get()]
+        while len(batch) < SESSION_WRITE_BATCH_SIZE and not session_write_queue.empty():
+            batch.append(session_write_queue.get_nowait())
+
+        stop = None in batch
+        batch = [item for item in batch if item is not None]
+        if batch:
+            await write_session_batch(batch)
+        if stop:
+            return
+
+
+async def save_user_session(row):
+    """
+    Queue a session upsert and wait until it has been committed.
+    Raises a 503 if the session writer isn't running or the write doesn't finish
+    within SESSION_WRITE_TIMEOUT, so Typeform redelivers the event.
+    """
+    writer = getattr(app.state, "session_writer", None)
+    if writer is None or writer.done():
+        logger.error("Session writer is not running; cannot save session for %s", row["user_id"])
+        raise HTTPException(status_code=503, detail="Session writer unavailable")
+
+    future = asyncio.get_running_loop().create_future()
+    await session_write_queue.put((row, future))
+    try:
+        await asyncio.wait_for(future, timeout=SESSION_WRITE_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.error("Timed out saving session for %s", row["user_id"])
+        raise HTTPException(status_code=503, detail="Timed out saving session")
+
+
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database tables on application startup."""
-    init_db()
+    """Initialize database tables and start the session writer on application startup."""
+    await init_db()
     logger.info("Database initialized")
+    app.state.session_writer = asyncio.create_task(run_session_writer())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued session writes and close shared HTTP connections on application shutdown."""
+    await session_write_queue.put(None)
+    await app.state.session_writer
+    await http_client.aclose()
 
 
 @app.post("/webhook")
-async def handle_typeform_webhook(request: Request, db: Session = Depends(get_db)):
+async def handle_typeform_webhook(request: Request):
     """
     Async endpoint to capture TypeForm webhook payload.
     Updates database with segment and status.
     Returns JSON with status = success.
     """
+    # Malformed or invalid payloads are expected failures: answer 400 and
+    # log without a traceback. Anything unexpected is left to the server
+    # error middleware, which logs it in full.
     try:
         # Parse the incoming JSON payload
-        payload_data = await request.json()
+        payload_data = orjson.loads(await request.body())
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Raw webhook payload: %s", payload_data)
 
         # Parse and validate the payload using Pydantic schema
-        webhook_payload = TypeformWebhookPayload(**payload_data)
-        user_id = webhook_payload.get_user_id()
-
-        if not user_id:
-            logger.warning("Invalid or Missing User ID. Ignoring.")
-            return JSONResponse(
-                status_code=200,
-                content={"status": "ignored", "reason": "invalid_user_id"}
-            )
-
-        # Extract required fields
-        form_response = webhook_payload.form_response
-        survey_responses = webhook_payload.form_response.get_answers_with_questions()
-
-        # Determine Segment using configuration-based logic
-        segment, survey_status = determine_segment(survey_responses)
-
-        # Check if user session already exists
-        user_session = db.query(UserSession).filter(UserSession.user_id == user_id).first()
-
-        # Parse submitted_at if available
-        submitted_at = datetime.utcnow()
-        if form_response.submitted_at:
-            try:
-                submitted_at = datetime.fromisoformat(form_response.submitted_at.replace('Z', '+00:00'))
-            except Exception as e:
-                logger.warning(f"Could not parse submitted_at: {e}")
-
-        if user_session:
-            # Update existing session
-            user_session.survey_status = survey_status
-            user_session.segment = segment
-            user_session.submitted_at = submitted_at
-        else:
-            # Create new session
-            user_session = UserSession(
-                user_id=user_id,
-                survey_status=survey_status,
-                segment=segment,
-                form_id=form_response.form_id,
-                form_token=form_response.token,
-                event_id=webhook_payload.event_id,
-                submitted_at=submitted_at
-            )
-            db.add(user_session)
-
-        # Commit changes to database
-        db.commit()
-
-        # Return success response
-        return JSONResponse(
-            status_code=200,
-            content={"status": "success"}
-        )
-
-    except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}", exc_info=True)
+        webhook_payload = TypeformWebhookPayload.model_validate(payload_data)
+    except (orjson.JSONDecodeError, ValidationError) as e:
+        logger.warning("Invalid webhook payload: %s", e)
         raise HTTPException(
             status_code=400,
             detail=f"Error processing webhook: {str(e)}"
         )
+    user_id = webhook_payload.get_user_id()
+
+    if not user_id:
+        logger.warning("Invalid or Missing User ID. Ignoring.")
+        return {"status": "ignored", "reason": "invalid_user_id"}
+
+    # Extract required fields
+    form_response = webhook_payload.form_response
+    survey_responses = webhook_payload.form_response.answers_with_questions
+
+    # Determine Segment using configuration-based logic
+    segment, survey_status = determine_segment(survey_responses)
+
+    # Skip redeliveries of an event that has already been saved with the same outcome
+    event_id = webhook_payload.event_id
+    fingerprint = hash((user_id, segment, survey_status.value, event_id))
+    if processed_events.get(event_id) == fingerprint:
+        return {"status": "success", "dedup": True}
+
+    # Parse submitted_at if available
+    submitted_at = datetime.utcnow()
+    if form_response.submitted_at:
+        try:
+            submitted_at = parse_iso_datetime(form_response.submitted_at)
+        except ValueError as e:
+            logger.warning("Could not parse submitted_at: %s", e)
+
+    # Create the session, or update status/segment of an existing one.
+    # The write is batched with other webhooks and committed before returning,
+    # so a failed write is answered with a 5xx and Typeform redelivers the event.
+    try:
+        await save_user_session({
+            "user_id": user_id,
+            "survey_status": survey_status,
+            "segment": segment,
+            "form_id": form_response.form_id,
+            "form_token": form_response.token,
+            "event_id": event_id,
+            "submitted_at": submitted_at
+        })
+    except IntegrityError as e:
+        # The event_id or form_token already belongs to another session. Redelivery
+        # can never succeed, so acknowledge the event instead of asking for a retry.
+        logger.warning("Conflicting submission for event %s. Ignoring: %s", event_id, e)
+        return {"status": "ignored", "reason": "conflicting_submission"}
+    except SQLAlchemyError as e:
+        logger.error("Error saving session for event %s: %s", event_id, e)
+        raise HTTPException(status_code=500, detail="Database error")
+    remember_processed_event(event_id, fingerprint)
+
+    # Return success response
+    return {"status": "success"}
 
 
 @app.get("/health")